@@ -1,10 +1,10 @@
 """Functions for loading and saving cubes."""
-import copy
 import logging
 import os
 import shutil
-from collections import OrderedDict
-from itertools import groupby
+import stat
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from warnings import catch_warnings, filterwarnings
 
 import iris
@@ -12,6 +12,11 @@ import iris.exceptions
 import numpy as np
 import yaml
 
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
 from .._task import write_ncl_settings
 from ..cmor._fixes.shared import AtmosphereSigmaFactory
 from ._time import extract_time
@@ -19,6 +24,7 @@ from ._time import extract_time
 logger = logging.getLogger(__name__)
 
 GLOBAL_FILL_VALUE = 1e+20
+CHUNK_TARGET_BYTES = 10 * 1024 * 1024
 
 DATASET_KEYS = {
     'mip',
@@ -27,6 +33,11 @@ VARIABLE_KEYS = {
     'reference_dataset',
     'alternative_dataset',
 }
+CALLBACK_REMOVED_ATTRIBUTES = {
+    'creation_date',
+    'tracking_id',
+    'history',
+}
 
 
 def _fix_aux_factories(cube):
@@ -80,23 +91,20 @@ def _fix_aux_factories(cube):
 
 def _get_attr_from_field_coord(ncfield, coord_name, attr):
     if coord_name is not None:
-        attrs = ncfield.cf_group[coord_name].cf_attrs()
-        attr_val = [value for (key, value) in attrs if key == attr]
-        if attr_val:
-            return attr_val[0]
+        attrs = dict(ncfield.cf_group[coord_name].cf_attrs())
+        return attrs.get(attr)
     return None
 
 
 def concatenate_callback(raw_cube, field, _):
     """Use this callback to fix anything Iris tries to break."""
     # Remove attributes that cause issues with merging and concatenation
-    for attr in ['creation_date', 'tracking_id', 'history']:
-        if attr in raw_cube.attributes:
-            del raw_cube.attributes[attr]
-    for coord in raw_cube.coords():
+    for attr in raw_cube.attributes.keys() & CALLBACK_REMOVED_ATTRIBUTES:
+        del raw_cube.attributes[attr]
+    for standard_name in ['longitude', 'latitude']:
         # Iris chooses to change longitude and latitude units to degrees
         # regardless of value in file, so reinstating file value
-        if coord.standard_name in ['longitude', 'latitude']:
+        for coord in raw_cube.coords(standard_name=standard_name):
             units = _get_attr_from_field_coord(field, coord.var_name, 'units')
             if units is not None:
                 coord.units = units
@@ -127,18 +135,38 @@ def load(file, callback=None):
     return raw_cubes
 
 
+def _get_attr_token(val):
+    """Get a hashable token identifying an attribute value."""
+    if isinstance(val, (str, int)):
+        return (type(val), val)
+    if isinstance(val, np.ndarray):
+        return (val.dtype.str, val.shape, val.tobytes())
+    return repr(val)
+
+
 def _fix_cube_attributes(cubes):
     """Unify attributes of different cubes to allow concatenation."""
-    attributes = {}
+    if len(cubes) < 2:
+        return
+    values = defaultdict(list)
+    tokens = defaultdict(set)
     for cube in cubes:
         for (attr, val) in cube.attributes.items():
-            if attr not in attributes:
-                attributes[attr] = val
-            else:
-                if not np.array_equal(val, attributes[attr]):
-                    attributes[attr] = '{};{}'.format(str(attributes[attr]),
-                                                      str(val))
+            token = _get_attr_token(val)
+            if token not in tokens[attr]:
+                tokens[attr].add(token)
+                values[attr].append(val)
+    attributes = {
+        attr: vals[0] if len(vals) == 1 else ';'.join(str(v) for v in vals)
+        for (attr, vals) in values.items()
+    }
+    # If all values agree, cubes that already have every attribute are
+    # unchanged; skip them, since assigning attributes makes Iris copy and
+    # validate them
+    differing = any(len(vals) > 1 for vals in values.values())
     for cube in cubes:
+        if not differing and cube.attributes.keys() == attributes.keys():
+            continue
         cube.attributes = attributes
 
 
@@ -198,6 +226,70 @@ def concatenate(cubes):
     return result
 
 
+def _largest_divisor(number, limit):
+    """Get the largest divisor of `number` that does not exceed `limit`."""
+    largest = 1
+    for small in range(1, int(number**0.5) + 1):
+        if number % small == 0:
+            for divisor in (small, number // small):
+                if largest < divisor <= limit:
+                    largest = divisor
+    return largest
+
+
+def _calc_chunks(shape, dtype_size, favored_dims, target_bytes=None):
+    """Calculate NetCDF chunk sizes of roughly `target_bytes` bytes.
+
+    Favored dimensions are kept at full length. The remaining dimensions,
+    starting with the fastest varying one, are enlarged until the chunk
+    reaches the target size, preferring chunk sizes that evenly divide
+    the dimension length.
+
+    Parameters
+    ----------
+    shape: tuple of int
+        Shape of the variable.
+    dtype_size: int
+        Size of a single element in bytes.
+    favored_dims: set of int
+        Dimensions that are not split into chunks.
+    target_bytes: int, optional
+        Target size of a single chunk in bytes. Defaults to
+        `CHUNK_TARGET_BYTES`.
+
+    Returns
+    -------
+    tuple of int
+        Chunk size for each dimension.
+
+    """
+    if target_bytes is None:
+        target_bytes = CHUNK_TARGET_BYTES
+    chunks = [
+        length if index in favored_dims else 1
+        for index, length in enumerate(shape)
+    ]
+    budget = target_bytes // dtype_size
+    for length in chunks:
+        budget //= max(length, 1)
+
+    for index in reversed(range(len(shape))):
+        if index in favored_dims:
+            continue
+        if budget <= 1:
+            break
+        length = shape[index]
+        if length <= budget:
+            chunks[index] = max(length, 1)
+            budget //= max(length, 1)
+        else:
+            divisor = _largest_divisor(length, budget)
+            chunks[index] = divisor if 2 * divisor >= budget else budget
+            break
+
+    return tuple(chunks)
+
+
 def save(cubes, filename, optimize_access='', compress=False, alias='',
          **kwargs):
     """
@@ -218,10 +310,17 @@ def save(cubes, filename, optimize_access='', compress=False, alias='',
         reading the file one map or time series at a time.
         Users can also provide a coordinate or a list of coordinates. In that
         case the better performance will be avhieved by loading all the values
-        in that coordinate at a time
+        in that coordinate at a time. The remaining dimensions are chunked so
+        that a single chunk has a size of about 10 MB.
 
     compress: bool, optional
-        Use NetCDF internal compression.
+        Use NetCDF internal compression. Unless specified otherwise, the
+        shuffle filter is enabled and a compression level of 4 is used. If
+        no chunk sizes are given and all cubes have the same shape, chunks of
+        about 10 MB that keep the latitude and longitude dimensions at full
+        length are used. For cubes without latitude and longitude
+        coordinates, the chunks grow from the fastest varying dimension
+        instead. If the cubes differ in shape, no chunk sizes are set.
 
     Returns
     -------
@@ -232,10 +331,12 @@ def save(cubes, filename, optimize_access='', compress=False, alias='',
     # Rename some arguments
     kwargs['target'] = filename
     kwargs['zlib'] = compress
+    if compress:
+        kwargs.setdefault('shuffle', True)
+        kwargs.setdefault('complevel', 4)
 
     dirname = os.path.dirname(filename)
-    if not os.path.exists(dirname):
-        os.makedirs(dirname)
+    os.makedirs(dirname, exist_ok=True)
 
     if (os.path.exists(filename)
             and all(cube.has_lazy_data() for cube in cubes)):
@@ -259,9 +360,19 @@ def save(cubes, filename, optimize_access='', compress=False, alias='',
                 dims += coord_dims
             dims = set(dims)
 
-        kwargs['chunksizes'] = tuple(
-            length if index in dims else 1
-            for index, length in enumerate(cube.shape))
+        kwargs['chunksizes'] = _calc_chunks(cube.shape, cube.dtype.itemsize,
+                                            dims)
+    elif compress and 'chunksizes' not in kwargs:
+        # Chunking largely determines the size of compressed files, so use
+        # horizontal slices instead of the NetCDF library defaults
+        cube = cubes[0]
+        if cube.shape and all(c.shape == cube.shape for c in cubes):
+            dims = set()
+            for name in ('latitude', 'longitude'):
+                for coord in cube.coords(name):
+                    dims.update(cube.coord_dims(coord))
+            kwargs['chunksizes'] = _calc_chunks(cube.shape,
+                                                cube.dtype.itemsize, dims)
 
     kwargs['fill_value'] = GLOBAL_FILL_VALUE
     if alias:
@@ -278,10 +389,13 @@ def save(cubes, filename, optimize_access='', compress=False, alias='',
 def _get_debug_filename(filename, step):
     """Get a filename for debugging the preprocessor."""
     dirname = os.path.splitext(filename)[0]
-    if os.path.exists(dirname) and os.listdir(dirname):
-        num = int(sorted(os.listdir(dirname)).pop()[:2]) + 1
-    else:
+    try:
+        with os.scandir(dirname) as entries:
+            latest = max(entry.name[:2] for entry in entries)
+    except (FileNotFoundError, ValueError):
         num = 0
+    else:
+        num = int(latest) + 1
     filename = os.path.join(dirname, '{:02}_{}.nc'.format(num, step))
     return filename
 
@@ -292,32 +406,43 @@ def cleanup(files, remove=None):
         remove = []
 
     for path in remove:
-        if os.path.isdir(path):
+        try:
+            mode = os.lstat(path).st_mode
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if stat.S_ISDIR(mode):
             shutil.rmtree(path)
-        elif os.path.isfile(path):
+        elif stat.S_ISREG(mode) or stat.S_ISLNK(mode):
             os.remove(path)
 
     return files
 
 
-def _ordered_safe_dump(data, stream):
-    """Write data containing OrderedDicts to yaml file."""
-    class _OrderedDumper(yaml.SafeDumper):
-        pass
+class _OrderedDumper(SafeDumper):
+    """Yaml dumper that writes OrderedDicts as regular mappings."""
+
+
+def _dict_representer(dumper, data):
+    return dumper.represent_mapping(
+        yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, data.items())
 
-    def _dict_representer(dumper, data):
-        return dumper.represent_mapping(
-            yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, data.items())
 
-    _OrderedDumper.add_representer(OrderedDict, _dict_representer)
+_OrderedDumper.add_representer(OrderedDict, _dict_representer)
+
+
+def _ordered_safe_dump(data, stream):
+    """Write data containing OrderedDicts to yaml file."""
     return yaml.dump(data, stream, _OrderedDumper)
 
 
 def write_metadata(products, write_ncl=False):
     """Write product metadata to file."""
-    output_files = []
-    for output_dir, prods in groupby(products,
-                                     lambda p: os.path.dirname(p.filename)):
+    products_per_dir = defaultdict(list)
+    for product in products:
+        products_per_dir[os.path.dirname(product.filename)].append(product)
+
+    jobs = []
+    for output_dir, prods in products_per_dir.items():
         sorted_products = sorted(
             prods,
             key=lambda p: (
@@ -333,26 +458,53 @@ def write_metadata(products, write_ncl=False):
             if 'original_short_name' in product.attributes:
                 del product.attributes['original_short_name']
             metadata[product.filename] = product.attributes
+        jobs.append((output_dir, metadata))
+
+    if not jobs:
+        return []
+    if len(jobs) == 1:
+        # Products usually share a single directory; no need for threads
+        return _write_metadata_files(*jobs[0], write_ncl=write_ncl)
+
+    # The files are independent, so write them concurrently
+    with ThreadPoolExecutor(max_workers=min(16, len(jobs))) as executor:
+        results = executor.map(
+            lambda job: _write_metadata_files(*job, write_ncl=write_ncl),
+            jobs)
+        output_files = [
+            filename for filenames in results for filename in filenames
+        ]
+
+    return output_files
 
-        output_filename = os.path.join(output_dir, 'metadata.yml')
-        output_files.append(output_filename)
-        with open(output_filename, 'w') as file:
-            _ordered_safe_dump(metadata, file)
-        if write_ncl:
-            output_files.append(_write_ncl_metadata(output_dir, metadata))
 
+def _write_metadata_files(output_dir, metadata, write_ncl=False):
+    """Write metadata of the products in output_dir to file."""
+    output_filename = os.path.join(output_dir, 'metadata.yml')
+    output_files = [output_filename]
+    with open(output_filename, 'w') as file:
+        _ordered_safe_dump(metadata, file)
+    if write_ncl:
+        output_files.append(_write_ncl_metadata(output_dir, metadata))
     return output_files
 
 
 def _write_ncl_metadata(output_dir, metadata):
     """Write NCL metadata files to output_dir."""
-    variables = [copy.deepcopy(v) for v in metadata.values()]
+    variables = list(metadata.values())
 
     info = {'input_file_info': variables}
 
     # Split input_file_info into dataset and variable properties
     # dataset keys and keys with non-identical values will be stored
     # in dataset_info, the rest in variable_info
+    missing = object()
+    dataset_specific = {}
+    for key in set().union(*variables):
+        values = [var.get(key, missing) for var in variables]
+        dataset_specific[key] = any(value != values[0]
+                                    for value in values[1:])
+
     variable_info = {}
     info['variable_info'] = [variable_info]
     info['dataset_info'] = []
@@ -360,9 +512,7 @@ def _write_ncl_metadata(output_dir, metadata):
         dataset_info = {}
         info['dataset_info'].append(dataset_info)
         for key in variable:
-            dataset_specific = any(variable[key] != var.get(key, object())
-                                   for var in variables)
-            if ((dataset_specific or key in DATASET_KEYS)
+            if ((dataset_specific[key] or key in DATASET_KEYS)
                     and key not in VARIABLE_KEYS):
                 dataset_info[key] = variable[key]
             else:
@@ -397,10 +547,14 @@ def _concatenate_overlapping_cubes(cubes):
             f"Cubes\n{cubes[0]}\nand\n{cubes[1]}\ncan not be concatenated: "
             f"time units {time_1.units}, calendar {time_1.units.calendar} "
             f"and {time_2.units}, calendar {time_2.units.calendar} differ")
-    data_start_1 = time_1.cell(0).point
-    data_start_2 = time_2.cell(0).point
-    data_end_1 = time_1.cell(-1).point
-    data_end_2 = time_2.cell(-1).point
+    (data_start_1, data_end_1, data_start_2,
+     data_end_2) = time_1.units.num2date(
+         np.array([
+             time_1.points[0],
+             time_1.points[-1],
+             time_2.points[0],
+             time_2.points[-1],
+         ]))
 
     # case 1: both cubes start at the same time -> return longer cube
     if data_start_1 == data_start_2:
@@ -422,9 +576,13 @@ def _concatenate_overlapping_cubes(cubes):
     # case 2: cube1 starts before cube2
     else:
         # find time overlap, if any
-        start_overlap = next((time_1.units.num2date(t)
-                              for t in time_1.points if t in time_2.points),
-                             None)
+        common = np.intersect1d(time_1.points,
+                                time_2.points,
+                                assume_unique=True)
+        if common.size:
+            start_overlap = time_1.units.num2date(common[0])
+        else:
+            start_overlap = None
         # case 2.0: no overlap (new iris implementation does allow
         # concatenation of cubes with no overlap)
         if not start_overlap:
@@ -1,6 +1,7 @@
 """Integration tests for :func:`esmvalcore.preprocessor._io.cleanup`"""
 
 import os
+import shutil
 import tempfile
 import unittest
 
@@ -37,3 +38,20 @@ class TestCleanup(unittest.TestCase):
         _io.cleanup([], self.temp_paths)
         for path in self.temp_paths:
             self.assertFalse(os.path.exists(path))
+
+    def test_cleanup_symlink_to_dir(self):
+        """Test cleanup removes a link to a directory but not its target"""
+        link_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, link_dir)
+        target = self.temp_paths[1]
+        link = os.path.join(link_dir, 'link')
+        os.symlink(target, link)
+        _io.cleanup([], [link])
+        self.assertFalse(os.path.lexists(link))
+        self.assertTrue(os.path.isdir(target))
+
+    def test_cleanup_path_below_file(self):
+        """Test cleanup skips paths below a regular file"""
+        path = os.path.join(self.temp_paths[0], 'missing')
+        _io.cleanup([], [path])
+        self.assertTrue(os.path.isfile(self.temp_paths[0]))
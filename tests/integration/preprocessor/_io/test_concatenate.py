@@ -483,3 +483,11 @@ class TestConcatenate(unittest.TestCase):
         _io._fix_cube_attributes(self.raw_cubes)  # noqa
         for cube in self.raw_cubes:
             self.assertEqual(cube.attributes, resulting_attrs)
+
+    def test_fix_attributes_repeated_values(self):
+        """Test that repeated attribute values are only listed once."""
+        for (cube, value) in zip(self.raw_cubes, ['a', 'b', 'a']):
+            cube.attributes['attr'] = value
+        _io._fix_cube_attributes(self.raw_cubes)  # noqa
+        for cube in self.raw_cubes:
+            self.assertEqual(cube.attributes, {'attr': 'a;b'})
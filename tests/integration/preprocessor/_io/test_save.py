@@ -3,6 +3,7 @@
 import os
 import tempfile
 import unittest
+from unittest import mock
 
 import iris
 import netCDF4
@@ -10,7 +11,7 @@ import numpy as np
 from iris.coords import DimCoord
 from iris.cube import Cube
 
-from esmvalcore.preprocessor import save
+from esmvalcore.preprocessor import _io, save
 
 
 class TestSave(unittest.TestCase):
@@ -78,12 +79,37 @@ class TestSave(unittest.TestCase):
         self.assertEqual(sample_filters['complevel'], 4)
         handler.close()
 
+    @mock.patch.object(_io, 'CHUNK_TARGET_BYTES', 8)
+    def test_save_zlib_default_chunks(self):
+        """Test save with compression favors horizontal chunks"""
+        cube, filename = self._create_sample_cube()
+        path = save([cube], filename, compress=True)
+        self._check_chunks(path, [2, 2, 1])
+
+    @mock.patch.object(_io, 'CHUNK_TARGET_BYTES', 8)
+    def test_save_zlib_user_chunks(self):
+        """Test save with compression keeps user provided chunks"""
+        cube, filename = self._create_sample_cube()
+        path = save([cube], filename, compress=True, chunksizes=(1, 2, 2))
+        self._check_chunks(path, [1, 2, 2])
+
+    def test_save_zlib_different_shapes(self):
+        """Test save with compression of cubes with different shapes"""
+        cube, filename = self._create_sample_cube()
+        other_cube = cube[..., 0]
+        other_cube.var_name = 'other'
+        with mock.patch('iris.save') as mock_save:
+            save([cube, other_cube], filename, compress=True)
+        mock_save.assert_called_once()
+        self.assertNotIn('chunksizes', mock_save.call_args[1])
+
     def test_fail_without_filename(self):
         """Test save fails if filename is not provided."""
         cube, _ = self._create_sample_cube()
         with self.assertRaises(TypeError):
             save([cube])
 
+    @mock.patch.object(_io, 'CHUNK_TARGET_BYTES', 8)
     def test_save_optimized_map(self):
         """Test save"""
         cube, filename = self._create_sample_cube()
@@ -92,6 +118,7 @@ class TestSave(unittest.TestCase):
         self._compare_cubes(cube, loaded_cube)
         self._check_chunks(path, [2, 2, 1])
 
+    @mock.patch.object(_io, 'CHUNK_TARGET_BYTES', 8)
     def test_save_optimized_timeseries(self):
         """Test save"""
         cube, filename = self._create_sample_cube()
@@ -100,6 +127,7 @@ class TestSave(unittest.TestCase):
         self._compare_cubes(cube, loaded_cube)
         self._check_chunks(path, [1, 1, 2])
 
+    @mock.patch.object(_io, 'CHUNK_TARGET_BYTES', 8)
     def test_save_optimized_lat(self):
         """Test save"""
         cube, filename = self._create_sample_cube()
@@ -115,6 +143,7 @@ class TestSave(unittest.TestCase):
         handler.close()
         self.assertListEqual(expected_chunks, chunking)
 
+    @mock.patch.object(_io, 'CHUNK_TARGET_BYTES', 8)
     def test_save_optimized_lon_time(self):
         """Test save"""
         cube, filename = self._create_sample_cube()
@@ -123,6 +152,28 @@ class TestSave(unittest.TestCase):
         self._compare_cubes(cube, loaded_cube)
         self._check_chunks(path, [1, 2, 2])
 
+    def test_calc_chunks_map(self):
+        """Test chunk sizes favouring maps"""
+        chunks = _io._calc_chunks((3650, 180, 360), 4, {1, 2})
+        self.assertEqual(chunks, (25, 180, 360))
+
+    def test_calc_chunks_timeseries(self):
+        """Test chunk sizes favouring time series"""
+        chunks = _io._calc_chunks((3650, 180, 360), 4, {0})
+        self.assertEqual(chunks, (3650, 1, 360))
+
+    def test_save_optimized_map_full_target(self):
+        """Test save with a cube smaller than the chunk target size"""
+        cube, filename = self._create_sample_cube()
+        path = save([cube], filename, optimize_access='map')
+        self._check_chunks(path, [2, 2, 2])
+
+    def test_calc_chunks_prime_length(self):
+        """Test chunk sizes for a dimension without suitable divisors"""
+        chunks = _io._calc_chunks((7919, 10, 10), 4, {1, 2},
+                                  target_bytes=4000)
+        self.assertEqual(chunks, (10, 10, 10))
+
     def _compare_cubes(self, cube, loaded_cube):
         self.assertTrue((cube.data == loaded_cube.data).all())
         for coord in cube.coords():
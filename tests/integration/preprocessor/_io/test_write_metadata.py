@@ -0,0 +1,38 @@
+"""Integration tests for :func:`esmvalcore.preprocessor._io.write_metadata`"""
+from unittest import mock
+
+import yaml
+
+from esmvalcore.preprocessor import _io
+
+
+def _create_product(filename, dataset):
+    product = mock.Mock(filename=str(filename))
+    product.attributes = {'dataset': dataset, 'short_name': 'tas'}
+    return product
+
+
+def test_write_metadata_unsorted_products(tmp_path):
+    """Test that products are grouped per directory regardless of order."""
+    dir_1 = tmp_path / 'dir_1'
+    dir_2 = tmp_path / 'dir_2'
+    dir_1.mkdir()
+    dir_2.mkdir()
+    products = [
+        _create_product(dir_1 / 'a.nc', 'a'),
+        _create_product(dir_2 / 'b.nc', 'b'),
+        _create_product(dir_1 / 'c.nc', 'c'),
+    ]
+
+    output_files = _io.write_metadata(products)
+
+    assert sorted(output_files) == [
+        str(dir_1 / 'metadata.yml'),
+        str(dir_2 / 'metadata.yml'),
+    ]
+    with open(dir_1 / 'metadata.yml') as file:
+        metadata = yaml.safe_load(file)
+    assert metadata == {
+        str(dir_1 / 'a.nc'): {'dataset': 'a', 'short_name': 'tas'},
+        str(dir_1 / 'c.nc'): {'dataset': 'c', 'short_name': 'tas'},
+    }
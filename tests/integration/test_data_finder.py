@@ -6,6 +6,11 @@ import tempfile
 import pytest
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 import esmvalcore._config
 from esmvalcore._data_finder import get_input_filelist, get_output_file
 from esmvalcore.cmor.table import read_cmor_tables
@@ -17,43 +22,54 @@ read_cmor_tables(esmvalcore._config.CFG)
 
 # Load test configuration
 with open(os.path.join(os.path.dirname(__file__), 'data_finder.yml')) as file:
-    CONFIG = yaml.safe_load(file)
+    CONFIG = yaml.load(file, Loader=SafeLoader)
 
 
-def print_path(path):
+def print_path(path, entry=None):
     """Print path."""
     txt = path
-    if os.path.isdir(path):
+    if entry is None:
+        entry_is_dir = os.path.isdir(path)
+        entry_is_symlink = os.path.islink(path)
+    else:
+        entry_is_dir = entry.is_dir()
+        entry_is_symlink = entry.is_symlink()
+    if entry_is_dir:
         txt += '/'
-    if os.path.islink(path):
+    if entry_is_symlink:
         txt += ' -> ' + os.readlink(path)
     print(txt)
 
 
+def _print_subtree(path):
+    """Print the contents of directory path, directories first."""
+    with os.scandir(path) as entries:
+        entries = list(entries)
+    dirs = [entry for entry in entries if entry.is_dir()]
+    files = [entry for entry in entries if not entry.is_dir()]
+    for entry in dirs + files:
+        print_path(entry.path, entry)
+    for entry in dirs:
+        if not entry.is_symlink():
+            _print_subtree(entry.path)
+
+
 def tree(path):
     """Print path, similar to the the `tree` command."""
     print_path(path)
-    for dirpath, dirnames, filenames in os.walk(path):
-        for dirname in dirnames:
-            print_path(os.path.join(dirpath, dirname))
-        for filename in filenames:
-            print_path(os.path.join(dirpath, filename))
-
-
-def create_file(filename):
-    """Create an empty file."""
-    dirname = os.path.dirname(filename)
-    if not os.path.exists(dirname):
-        os.makedirs(dirname)
-
-    with open(filename, 'a'):
-        pass
+    if os.path.isdir(path):
+        _print_subtree(path)
 
 
 def create_tree(path, filenames=None, symlinks=None):
     """Create directory structure and files."""
-    for filename in filenames or []:
-        create_file(os.path.join(path, filename))
+    filenames = [os.path.join(path, filename) for filename in filenames or []]
+    for dirname in {os.path.dirname(filename) for filename in filenames}:
+        os.makedirs(dirname, exist_ok=True)
+
+    for filename in filenames:
+        with open(filename, 'a'):
+            pass
 
     for symlink in symlinks or []:
         link_name = os.path.join(path, symlink['link_name'])